@@ -11,16 +11,109 @@ import datetime
 import asyncio
 import logging
 import json
+import hashlib
+import html
+import re
+import weakref
 from typing import Optional, Dict, List
 
 from azure.ai.agents import AgentsClient
-from azure.ai.agents.models import Agent, ThreadMessage, ThreadRun, AgentThread, ToolOutput, BingGroundingTool, ListSortOrder, FilePurpose, FileSearchTool, RequiredMcpToolCall, ToolApproval
+from azure.ai.agents.models import Agent, ThreadMessage, ThreadRun, AgentThread, ToolOutput, BingGroundingTool, ListSortOrder, FilePurpose, FileSearchTool, RequiredMcpToolCall, ToolApproval, MessageDeltaChunk, SubmitToolOutputsAction, AgentStreamEvent
 from azure.ai.projects import AIProjectClient
+from azure.core.exceptions import HttpResponseError
 from azure.identity import DefaultAzureCredential
-import glob
+
+try:
+    from email_config import send_email, send_email_with_cc
+except ImportError:
+    send_email = send_email_with_cc = None
 
 logger = logging.getLogger(__name__)
 
+# Agent instructions without the timestamp, so they can be built once and used as a stable pool key
+_STATIC_INSTRUCTIONS = """
+You are an Email Communications Specialist. Your job is to compose and send professional emails IMMEDIATELY without asking for confirmation.
+
+## HOW THIS WORKS
+
+When you receive information about an email to send, you must:
+
+1. **Extract the Information**:
+   - Recipient email address
+   - Subject line (create one based on context if not provided)
+   - The FULL content/report to include in the email body
+   - Any CC recipients (optional)
+
+2. **Compose and SEND IMMEDIATELY**: Create a professional email and output it in the EMAIL_TO_SEND format right away. DO NOT ask for confirmation or approval.
+
+3. **Output Format**: ALWAYS output the email in this EXACT format:
+
+```EMAIL_TO_SEND
+TO: recipient@example.com
+SUBJECT: Your Subject Here
+CC: optional@example.com (or leave blank)
+BODY:
+<html>
+<p>Your email content here...</p>
+</html>
+```END_EMAIL
+
+The system will automatically detect this format and send the email.
+
+## CRITICAL RULES
+
+- **NEVER** ask "Would you like me to send this?" or "Do you want any changes?"
+- **NEVER** show a draft and wait for approval
+- **ALWAYS** output the EMAIL_TO_SEND block immediately when you have the required info
+- If you have recipient + subject/topic + content, SEND IT immediately
+- **INCLUDE THE FULL REPORT IN THE BODY** - the system will use it to generate the PDF, then automatically shorten the email body
+- Use HTML formatting for professional appearance (<p>, <h2>, <ul>, <li>, <strong>, etc.)
+
+## EXAMPLE
+
+User: "Send this report to simon@company.com: [Report Title] Executive Summary... Key Findings... Recommendations..."
+
+You: "I'll send that email now.
+
+```EMAIL_TO_SEND
+TO: simon@company.com
+SUBJECT: Your AI Consultation Report
+CC: 
+BODY:
+<html>
+<p>Dear Simon,</p>
+<h2>Report Title</h2>
+<h3>Executive Summary</h3>
+<p>Your executive summary content here...</p>
+<h3>Key Findings</h3>
+<ul>
+<li>Finding 1</li>
+<li>Finding 2</li>
+</ul>
+<h3>Recommendations</h3>
+<p>Your recommendations here...</p>
+</html>
+```END_EMAIL"
+
+(The system will automatically generate a branded PDF from the full report and send a short email body referencing the attachment)
+
+"""
+
+# Patterns applied to the parsed email body only, never the full response
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_MULTI_SPACE_RE = re.compile(r' +')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+_GREETING_NAME_RE = re.compile(r'Dear\s+(\w+)', re.IGNORECASE)
+
+# Document types uploaded for file search
+_SUPPORTED_EXTS = frozenset({'txt', 'md', 'pdf', 'docx', 'json', 'csv'})
+
+# Maps uploaded documents (path, mtime, size) to file ids and the vector store built from them
+_VECTOR_STORE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "foundry_email_agent", "vs_cache.json")
+
+# Wall-clock budget for a run, streamed or polled
+_RUN_TIMEOUT_SECONDS = 50
+
 
 class FoundryEmailAgent:
     """
@@ -33,24 +126,48 @@ class FoundryEmailAgent:
     _shared_vector_store = None
     _shared_uploaded_files = []
     _shared_file_search_tool = None
-    _file_search_setup_lock = asyncio.Lock()
+    # Locks are created per event loop; a lock created at import would be tied to whichever loop used it first
+    _file_search_setup_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+    _max_upload_connections = 8  # Concurrent document uploads during file search setup
+
+    # Remote agents shared by instances with identical configuration
+    _agent_pool: Dict[str, Agent] = {}
+    _agent_pool_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+    # One credential for all instances so the credential chain probe and token cache are shared
+    _credential: Optional[DefaultAzureCredential] = None
     
     def __init__(self):
         self.endpoint = os.environ["AZURE_AI_FOUNDRY_PROJECT_ENDPOINT"]
-        self.credential = DefaultAzureCredential()
         self.agent: Optional[Agent] = None
-        self.threads: Dict[str, str] = {}
+        self.threads: set[str] = set()
         self._file_search_tool = None
         self._agents_client = None
         self._project_client = None
         self.last_token_usage: Optional[Dict[str, int]] = None  # Store token usage from last run
         
+    @staticmethod
+    def _loop_lock(locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]") -> asyncio.Lock:
+        """Get the lock for the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        lock = locks.get(loop)
+        if lock is None:
+            lock = locks[loop] = asyncio.Lock()
+        return lock
+    
+    @classmethod
+    def _get_credential(cls) -> DefaultAzureCredential:
+        """Get the process-wide DefaultAzureCredential, creating it on first use."""
+        if cls._credential is None:
+            cls._credential = DefaultAzureCredential(exclude_visual_studio_code_credential=True)
+        return cls._credential
+        
     def _get_client(self) -> AgentsClient:
         """Get a cached AgentsClient instance to reduce API calls."""
         if self._agents_client is None:
             self._agents_client = AgentsClient(
                 endpoint=self.endpoint,
-                credential=self.credential,
+                credential=self._get_credential(),
             )
         return self._agents_client
         
@@ -59,13 +176,175 @@ class FoundryEmailAgent:
         if self._project_client is None:
             self._project_client = AIProjectClient(
                 endpoint=self.endpoint,
-                credential=self.credential,
+                credential=self._get_credential(),
             )
         return self._project_client
     
+    async def _upload_with_retry(self, project_client: AIProjectClient, file_path: str, max_attempts: int = 3):
+        """Upload a single file, retrying throttled (429) and transient (5xx) failures with exponential backoff."""
+        for attempt in range(max_attempts):
+            try:
+                # upload_and_poll is blocking, run it in a worker thread so uploads overlap
+                return await asyncio.to_thread(
+                    project_client.agents.files.upload_and_poll,
+                    file_path=file_path,
+                    purpose=FilePurpose.AGENTS
+                )
+            except HttpResponseError as e:
+                retryable = e.status_code == 429 or (e.status_code is not None and e.status_code >= 500)
+                if not retryable or attempt == max_attempts - 1:
+                    raise
+                delay = 2 ** attempt
+                logger.warning(f"Upload of {os.path.basename(file_path)} failed ({e.status_code}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+    
+    def _load_vector_store_cache(self) -> dict:
+        """Load the on-disk file/vector store cache for this project endpoint."""
+        try:
+            with open(_VECTOR_STORE_CACHE_PATH, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable vector store cache: {e}")
+            return {}
+        # File and vector store ids are only valid for the project they were created in
+        if cache.get("endpoint") != self.endpoint:
+            return {}
+        return cache
+
+    @staticmethod
+    def _save_vector_store_cache(cache: dict) -> None:
+        """Persist the file/vector store cache so restarts can skip unchanged uploads."""
+        try:
+            os.makedirs(os.path.dirname(_VECTOR_STORE_CACHE_PATH), exist_ok=True)
+            with open(_VECTOR_STORE_CACHE_PATH, "w", encoding="utf-8") as f:
+                json.dump(cache, f, indent=2)
+        except Exception as e:
+            logger.warning(f"Could not write vector store cache: {e}")
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Remove the persisted file/vector store cache so the next setup re-uploads everything."""
+        try:
+            os.remove(_VECTOR_STORE_CACHE_PATH)
+            logger.info("Cleared vector store cache")
+        except FileNotFoundError:
+            pass
+    
+    @staticmethod
+    def _find_document_files(files_directory: str) -> List[str]:
+        """Collect supported documents under files_directory in a single directory walk."""
+        file_paths = []
+        for root, dirs, files in os.walk(files_directory):
+            # Skip hidden directories and files (.git, .ipynb_checkpoints, ...) as glob did
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for f in files:
+                if f.startswith('.'):
+                    continue
+                _, dot, ext = f.rpartition('.')
+                if dot and ext.lower() in _SUPPORTED_EXTS:
+                    file_paths.append(os.path.join(root, f))
+        return file_paths
+    
+    async def _build_file_search(self, file_paths: List[str], cache: dict) -> Optional[FileSearchTool]:
+        """Upload documents not covered by ``cache`` and build the shared vector store and file search tool."""
+        # Reuse file ids for documents whose path, mtime and size are unchanged
+        cached_files = cache.get("files", {})
+        file_entries = {}
+        file_ids = []
+        to_upload = []
+        for file_path in file_paths:
+            resolved = os.path.realpath(file_path)
+            entry = {"mtime": os.path.getmtime(file_path), "size": os.path.getsize(file_path)}
+            cached = cached_files.get(resolved)
+            if cached and cached.get("mtime") == entry["mtime"] and cached.get("size") == entry["size"]:
+                entry["file_id"] = cached["file_id"]
+                file_ids.append(cached["file_id"])
+                file_entries[resolved] = entry
+            else:
+                to_upload.append((file_path, resolved, entry))
+        
+        if file_ids:
+            logger.info(f"Reusing {len(file_ids)} previously uploaded files")
+        
+        project_client = self._get_project_client()
+        upload_semaphore = asyncio.Semaphore(FoundryEmailAgent._max_upload_connections)
+
+        async def _upload_one(file_path: str):
+            async with upload_semaphore:
+                logger.info(f"Uploading file: {os.path.basename(file_path)}")
+                return await self._upload_with_retry(project_client, file_path)
+
+        results = await asyncio.gather(
+            *[_upload_one(file_path) for file_path, _, _ in to_upload],
+            return_exceptions=True
+        )
+        for (file_path, resolved, entry), result in zip(to_upload, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Failed to upload {file_path}: {result}")
+                continue
+            entry["file_id"] = result.id
+            file_entries[resolved] = entry
+            file_ids.append(result.id)
+            logger.info(f"Uploaded file: {os.path.basename(file_path)}")
+        FoundryEmailAgent._shared_uploaded_files.extend(file_ids)
+        
+        if not file_ids:
+            return None
+        
+        vector_store = None
+        pending_file_ids = file_ids
+        cached_store_id = cache.get("vector_store_id")
+        cached_store_file_ids = set(cache.get("vector_store_file_ids", []))
+        # The cached store can be kept when documents were only added, not changed or removed
+        if cached_store_id and cached_store_file_ids and cached_store_file_ids <= set(file_ids):
+            try:
+                vector_store = await asyncio.to_thread(project_client.agents.vector_stores.get, cached_store_id)
+                pending_file_ids = [file_id for file_id in file_ids if file_id not in cached_store_file_ids]
+                logger.info(f"Reusing cached vector store: {cached_store_id}")
+            except Exception as e:
+                logger.info(f"Cached vector store {cached_store_id} unavailable: {e}")
+        
+        if vector_store is None:
+            logger.info("Creating shared vector store...")
+            vector_store = await asyncio.to_thread(
+                project_client.agents.vector_stores.create,
+                name="email_agent_vectorstore"
+            )
+        ingest_failed = False
+        if pending_file_ids:
+            # Ingest all files in one batch operation rather than one poll cycle per file
+            logger.info(f"Adding {len(pending_file_ids)} files to vector store {vector_store.id}")
+            batch = await asyncio.to_thread(
+                project_client.agents.vector_store_file_batches.create_and_poll,
+                vector_store_id=vector_store.id,
+                file_ids=pending_file_ids
+            )
+            if batch.status != "completed":
+                raise RuntimeError(f"Vector store file batch {batch.id} ended with status {batch.status}")
+            if batch.file_counts.failed:
+                logger.warning(f"{batch.file_counts.failed} files failed to ingest into vector store {vector_store.id}")
+                ingest_failed = True
+        FoundryEmailAgent._shared_vector_store = vector_store
+        
+        # Only cache a fully ingested store, so a partial ingest is retried on the next start
+        if not ingest_failed:
+            self._save_vector_store_cache({
+                "endpoint": self.endpoint,
+                "files": file_entries,
+                "vector_store_id": vector_store.id,
+                "vector_store_file_ids": file_ids,
+            })
+        
+        file_search = FileSearchTool(vector_store_ids=[FoundryEmailAgent._shared_vector_store.id])
+        FoundryEmailAgent._shared_file_search_tool = file_search
+        logger.info("File search capability ready")
+        return file_search
+    
     async def _setup_file_search(self, files_directory: str = "documents") -> Optional[FileSearchTool]:
         """Upload files from local directory and create vector store for file search."""
-        async with FoundryEmailAgent._file_search_setup_lock:
+        async with FoundryEmailAgent._loop_lock(FoundryEmailAgent._file_search_setup_locks):
             if FoundryEmailAgent._shared_file_search_tool is not None:
                 logger.info("Reusing existing shared file search tool")
                 return FoundryEmailAgent._shared_file_search_tool
@@ -75,49 +354,25 @@ class FoundryEmailAgent:
                     logger.info(f"No {files_directory} directory found, skipping file search setup")
                     return None
                 
-                supported_extensions = ['*.txt', '*.md', '*.pdf', '*.docx', '*.json', '*.csv']
-                file_paths = set()
-                for ext in supported_extensions:
-                    file_paths.update(glob.glob(os.path.join(files_directory, ext)))
-                    file_paths.update(glob.glob(os.path.join(files_directory, "**", ext), recursive=True))
-                
-                file_paths = list(file_paths)
+                file_paths = await asyncio.to_thread(self._find_document_files, files_directory)
                 
                 if not file_paths:
                     logger.info(f"No supported files found in {files_directory}")
                     return None
                 
-                logger.info(f"Found {len(file_paths)} files to upload")
+                logger.info(f"Found {len(file_paths)} documents")
                 
-                file_ids = []
-                project_client = self._get_project_client()
-                for file_path in file_paths:
-                    try:
-                        logger.info(f"Uploading file: {os.path.basename(file_path)}")
-                        file = project_client.agents.files.upload_and_poll(
-                            file_path=file_path, 
-                            purpose=FilePurpose.AGENTS
-                        )
-                        file_ids.append(file.id)
-                        FoundryEmailAgent._shared_uploaded_files.append(file.id)
-                        logger.info(f"Uploaded file: {os.path.basename(file_path)}")
-                    except Exception as e:
-                        logger.warning(f"Failed to upload {file_path}: {e}")
-                
-                if not file_ids:
-                    return None
-                
-                logger.info("Creating shared vector store...")
-                FoundryEmailAgent._shared_vector_store = project_client.agents.vector_stores.create_and_poll(
-                    file_ids=file_ids, 
-                    name="email_agent_vectorstore"
-                )
-                
-                file_search = FileSearchTool(vector_store_ids=[FoundryEmailAgent._shared_vector_store.id])
-                FoundryEmailAgent._shared_file_search_tool = file_search
-                logger.info("File search capability ready")
-                    
-                return file_search
+                cache = self._load_vector_store_cache()
+                try:
+                    return await self._build_file_search(file_paths, cache)
+                except Exception as e:
+                    if not cache:
+                        raise
+                    # Cached file ids or the cached store may have been deleted remotely;
+                    # drop the cache and rebuild once with every document uploaded afresh
+                    logger.warning(f"File search setup from cache failed, rebuilding without it: {e}")
+                    FoundryEmailAgent.clear_cache()
+                    return await self._build_file_search(file_paths, {})
                     
             except Exception as e:
                 logger.error(f"Error setting up file search: {e}")
@@ -136,7 +391,7 @@ class FoundryEmailAgent:
         
         # Add Bing search if available
         try:
-            bing_connection = project_client.connections.get(name="agentbing")
+            bing_connection = await asyncio.to_thread(project_client.connections.get, name="agentbing")
             bing = BingGroundingTool(connection_id=bing_connection.id)
             tools.extend(bing.definitions)
             logger.info("Added Bing search capability")
@@ -147,116 +402,75 @@ class FoundryEmailAgent:
         if self._file_search_tool is None:
             self._file_search_tool = await self._setup_file_search()
         
-        if self._file_search_tool:
-            if hasattr(self._file_search_tool, 'definitions'):
-                tools.extend(self._file_search_tool.definitions)
-            if hasattr(self._file_search_tool, 'resources'):
-                tool_resources = self._file_search_tool.resources
+        if self._file_search_tool is not None:
+            tools.extend(self._file_search_tool.definitions)
+            tool_resources = self._file_search_tool.resources
             logger.info("Added file search capability")
         
-        with project_client:
-            if tool_resources:
-                self.agent = project_client.agents.create_agent(
-                    model="gpt-4o",
-                    name="email-agent",
-                    instructions=self._get_agent_instructions(),
-                    tools=tools,
-                    tool_resources=tool_resources
-                )
-            else:
-                self.agent = project_client.agents.create_agent(
-                    model="gpt-4o",
-                    name="email-agent",
-                    instructions=self._get_agent_instructions(),
-                    tools=tools
-                )
+        model = "gpt-4o"
+        # Key on the static instructions so the embedded timestamp doesn't force a new remote agent
+        cfg_key = self._agent_config_key(model, _STATIC_INSTRUCTIONS, tools, tool_resources)
+        
+        async with FoundryEmailAgent._loop_lock(FoundryEmailAgent._agent_pool_locks):
+            pooled_agent = FoundryEmailAgent._agent_pool.get(cfg_key)
+            if pooled_agent is not None:
+                self.agent = pooled_agent
+                logger.info(f"Reusing pooled Email Agent: {self.agent.id}")
+                return self.agent
+            
+            instructions = self._get_agent_instructions()
+            with project_client:
+                if tool_resources:
+                    self.agent = await asyncio.to_thread(
+                        project_client.agents.create_agent,
+                        model=model,
+                        name="email-agent",
+                        instructions=instructions,
+                        tools=tools,
+                        tool_resources=tool_resources
+                    )
+                else:
+                    self.agent = await asyncio.to_thread(
+                        project_client.agents.create_agent,
+                        model=model,
+                        name="email-agent",
+                        instructions=instructions,
+                        tools=tools
+                    )
+            
+            FoundryEmailAgent._agent_pool[cfg_key] = self.agent
         
         logger.info(f"Created Email Agent: {self.agent.id}")
         return self.agent
     
+    @staticmethod
+    def _agent_config_key(model: str, instructions: str, tools: list, tool_resources) -> str:
+        """Hash the agent configuration so identical configurations share one remote agent."""
+        config = {
+            "model": model,
+            "instructions": instructions,
+            "tools": tools,
+            "tool_resources": tool_resources,
+        }
+        return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+    
     def _get_agent_instructions(self) -> str:
         """Get the agent instructions for email composition and sending."""
-        return f"""
-You are an Email Communications Specialist. Your job is to compose and send professional emails IMMEDIATELY without asking for confirmation.
-
-## HOW THIS WORKS
-
-When you receive information about an email to send, you must:
-
-1. **Extract the Information**:
-   - Recipient email address
-   - Subject line (create one based on context if not provided)
-   - The FULL content/report to include in the email body
-   - Any CC recipients (optional)
-
-2. **Compose and SEND IMMEDIATELY**: Create a professional email and output it in the EMAIL_TO_SEND format right away. DO NOT ask for confirmation or approval.
-
-3. **Output Format**: ALWAYS output the email in this EXACT format:
-
-```EMAIL_TO_SEND
-TO: recipient@example.com
-SUBJECT: Your Subject Here
-CC: optional@example.com (or leave blank)
-BODY:
-<html>
-<p>Your email content here...</p>
-</html>
-```END_EMAIL
-
-The system will automatically detect this format and send the email.
-
-## CRITICAL RULES
-
-- **NEVER** ask "Would you like me to send this?" or "Do you want any changes?"
-- **NEVER** show a draft and wait for approval
-- **ALWAYS** output the EMAIL_TO_SEND block immediately when you have the required info
-- If you have recipient + subject/topic + content, SEND IT immediately
-- **INCLUDE THE FULL REPORT IN THE BODY** - the system will use it to generate the PDF, then automatically shorten the email body
-- Use HTML formatting for professional appearance (<p>, <h2>, <ul>, <li>, <strong>, etc.)
-
-## EXAMPLE
-
-User: "Send this report to simon@company.com: [Report Title] Executive Summary... Key Findings... Recommendations..."
-
-You: "I'll send that email now.
-
-```EMAIL_TO_SEND
-TO: simon@company.com
-SUBJECT: Your AI Consultation Report
-CC: 
-BODY:
-<html>
-<p>Dear Simon,</p>
-<h2>Report Title</h2>
-<h3>Executive Summary</h3>
-<p>Your executive summary content here...</p>
-<h3>Key Findings</h3>
-<ul>
-<li>Finding 1</li>
-<li>Finding 2</li>
-</ul>
-<h3>Recommendations</h3>
-<p>Your recommendations here...</p>
-</html>
-```END_EMAIL"
-
-(The system will automatically generate a branded PDF from the full report and send a short email body referencing the attachment)
-
-Current date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
-"""
+        return _STATIC_INSTRUCTIONS + f"Current date: {datetime.datetime.now():%Y-%m-%d %H:%M}\n"
     
     async def create_thread(self, thread_id: Optional[str] = None) -> AgentThread:
         """Create or retrieve a conversation thread."""
         client = self._get_client()
-        thread = client.threads.create()
-        self.threads[thread.id] = thread.id
+        thread = await asyncio.to_thread(client.threads.create)
+        self.threads.add(thread.id)
         logger.info(f"Created thread: {thread.id}")
         return thread
     
     async def send_message(self, thread_id: str, content: str, role: str = "user") -> ThreadMessage:
         """Send a message to the conversation thread."""
         client = self._get_client()
-        message = client.messages.create(
+        message = await asyncio.to_thread(
+            client.messages.create,
             thread_id=thread_id,
             role=role,
             content=content
@@ -264,6 +478,60 @@ Current date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
         logger.info(f"Created message in thread {thread_id}")
         return message
     
+    def _stream_run(self, client: AgentsClient, thread_id: str,
+                    deadline: float) -> tuple[Optional[ThreadRun], Optional[str]]:
+        """Drive a run through the SDK streaming API.
+
+        Blocking - call via asyncio.to_thread. Returns the final run and the text of the
+        last assistant message assembled from the streamed deltas. Once ``deadline``
+        (time.monotonic) has passed the run is cancelled and TimeoutError is raised.
+        """
+        run = None
+        message_id = None
+        text_parts: List[str] = []
+
+        with client.runs.stream(thread_id=thread_id, agent_id=self.agent.id) as stream:
+            for event_type, event_data, _ in stream:
+                if time.monotonic() >= deadline:
+                    if run is not None:
+                        try:
+                            client.runs.cancel(thread_id=thread_id, run_id=run.id)
+                        except Exception as e:
+                            logger.debug(f"Could not cancel timed out run {run.id}: {e}")
+                    raise TimeoutError("Request timed out")
+                if isinstance(event_data, MessageDeltaChunk):
+                    # Only keep the text of the most recent assistant message
+                    if event_data.id != message_id:
+                        message_id = event_data.id
+                        text_parts = []
+                    text_parts.append(event_data.text)
+                elif isinstance(event_data, ThreadRun):
+                    run = event_data
+                    if run.status == "requires_action" and isinstance(run.required_action, SubmitToolOutputsAction):
+                        # Built-in tools (Bing, file search) just need empty outputs
+                        tool_outputs = [
+                            ToolOutput(tool_call_id=tool_call.id, output="{}")
+                            for tool_call in run.required_action.submit_tool_outputs.tool_calls
+                        ]
+                        client.runs.submit_tool_outputs_stream(
+                            thread_id=thread_id,
+                            run_id=run.id,
+                            tool_outputs=tool_outputs,
+                            event_handler=stream
+                        )
+                elif event_type == AgentStreamEvent.ERROR:
+                    raise RuntimeError(f"Stream error: {event_data}")
+
+        return run, ("".join(text_parts) if message_id else None)
+
+    def _format_response(self, text_content: str) -> str:
+        """Send any EMAIL_TO_SEND block in the response and return the text to show the caller."""
+        email_result, clean_content = self._try_send_email(text_content)
+        if email_result:
+            # Show clean summary instead of raw EMAIL_TO_SEND block
+            return f"{clean_content}\n\n{email_result}"
+        return text_content
+
     async def run_conversation_stream(self, thread_id: str, user_message: str):
         """Run the conversation and yield responses."""
         if not self.agent:
@@ -271,38 +539,63 @@ Current date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
 
         await self.send_message(thread_id, user_message)
         client = self._get_client()
-        run = client.runs.create(thread_id=thread_id, agent_id=self.agent.id)
-
-        max_iterations = 25
-        iterations = 0
-
-        while run.status in ["queued", "in_progress", "requires_action"] and iterations < max_iterations:
-            iterations += 1
-            await asyncio.sleep(2)
+        response_text = None
 
+        if hasattr(client.runs, "stream"):
+            # Stream the run so completion is picked up as soon as the model finishes.
+            # The worker stops at its next event after the deadline; wait_for bounds a silent stream.
+            deadline = time.monotonic() + _RUN_TIMEOUT_SECONDS
             try:
-                run = client.runs.get(thread_id=thread_id, run_id=run.id)
+                run, response_text = await asyncio.wait_for(
+                    asyncio.to_thread(self._stream_run, client, thread_id, deadline),
+                    timeout=_RUN_TIMEOUT_SECONDS,
+                )
+            except TimeoutError:
+                yield "Error: Request timed out"
+                return
             except Exception as e:
                 yield f"Error: {str(e)}"
                 return
 
-            if run.status == "failed":
-                yield f"Error: {run.last_error}"
+            if run is None:
+                yield "Error: Run stream ended without a run status"
                 return
+        else:
+            # Older SDKs without streaming support fall back to polling
+            run = await asyncio.to_thread(client.runs.create, thread_id=thread_id, agent_id=self.agent.id)
+
+            # Poll with exponential backoff so short runs return quickly; the
+            # overall budget is wall-clock based so it doesn't depend on the delay schedule
+            deadline = time.monotonic() + _RUN_TIMEOUT_SECONDS
+            delay = 0.2
+
+            while run.status in ["queued", "in_progress", "requires_action"]:
+                if time.monotonic() >= deadline:
+                    yield "Error: Request timed out"
+                    return
+                await asyncio.sleep(delay)
+                delay = min(delay * 1.5, 2.0)
+
+                try:
+                    run = await asyncio.to_thread(client.runs.get, thread_id=thread_id, run_id=run.id)
+                except Exception as e:
+                    yield f"Error: {str(e)}"
+                    return
+
+                if run.status == "failed":
+                    yield f"Error: {run.last_error}"
+                    return
 
-            if run.status == "requires_action":
-                if hasattr(run, 'required_action') and run.required_action:
-                    await self._handle_tool_calls(run, thread_id)
-                run = client.runs.get(thread_id=thread_id, run_id=run.id)
+                if run.status == "requires_action":
+                    if hasattr(run, 'required_action') and run.required_action:
+                        await self._handle_tool_calls(run, thread_id, client)
+                    run = await asyncio.to_thread(client.runs.get, thread_id=thread_id, run_id=run.id)
+                    delay = 0.2
 
         if run.status == "failed":
             yield f"Error: {run.last_error}"
             return
 
-        if iterations >= max_iterations:
-            yield "Error: Request timed out"
-            return
-
         # Extract token usage from completed run
         if hasattr(run, 'usage') and run.usage:
             self.last_token_usage = {
@@ -314,58 +607,77 @@ Current date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
         else:
             self.last_token_usage = None
 
-        # Get the response
-        messages = list(client.messages.list(thread_id=thread_id, order=ListSortOrder.ASCENDING))
-        for msg in reversed(messages):
-            if msg.role == "assistant" and msg.content:
-                for content_item in msg.content:
-                    if hasattr(content_item, 'text'):
-                        text_content = content_item.text.value
-                        
-                        # Check if there's an email to send
-                        email_result, clean_content = self._try_send_email(text_content)
-                        if email_result:
-                            # Show clean summary instead of raw EMAIL_TO_SEND block
-                            yield f"{clean_content}\n\n{email_result}"
-                        else:
-                            yield text_content
-                break
+        if response_text is not None:
+            yield await asyncio.to_thread(self._format_response, response_text)
+            return
+
+        # Get the response - newest first from this run only, one message per page, stopping
+        # at the first assistant reply so the rest of the thread is never fetched
+        msg = await asyncio.to_thread(
+            lambda: next(
+                (m for m in client.messages.list(
+                    thread_id=thread_id, run_id=run.id, order=ListSortOrder.DESCENDING, limit=1)
+                 if m.role == "assistant" and m.content),
+                None
+            )
+        )
+        if msg is not None:
+            for content_item in msg.content:
+                if hasattr(content_item, 'text'):
+                    yield await asyncio.to_thread(self._format_response, content_item.text.value)
     
     def _try_send_email(self, response_text: str) -> tuple[Optional[str], str]:
         """Check if the response contains an email to send and send it.
         Returns: (result_message, cleaned_content)
         """
-        import re
+        # Most responses carry no email, so bail out before any parsing
+        if 'EMAIL_TO_SEND' not in response_text:
+            return None, response_text
         
         # Look for the EMAIL_TO_SEND block
-        pattern = r'```EMAIL_TO_SEND\s*\n(.*?)\n```END_EMAIL'
-        match = re.search(pattern, response_text, re.DOTALL)
-        
-        if not match:
+        fence_start = response_text.find('```EMAIL_TO_SEND')
+        if fence_start == -1:
+            return None, response_text
+        block_start = response_text.find('\n', fence_start)
+        block_end = response_text.find('\n```END_EMAIL', block_start) if block_start != -1 else -1
+        if block_end == -1:
             return None, response_text
         
-        email_block = match.group(1)
+        email_block = response_text[block_start + 1:block_end]
         
-        # Parse the email fields
-        to_match = re.search(r'^TO:\s*(.+)$', email_block, re.MULTILINE)
-        subject_match = re.search(r'^SUBJECT:\s*(.+)$', email_block, re.MULTILINE)
-        cc_match = re.search(r'^CC:\s*(.*)$', email_block, re.MULTILINE)
-        body_match = re.search(r'^BODY:\s*\n(.+)', email_block, re.DOTALL | re.MULTILINE)
+        # Parse the email fields in a single pass; everything after BODY: is the body
+        to = subject = cc = None
+        body_lines = None
+        for line in email_block.splitlines():
+            if body_lines is not None:
+                body_lines.append(line)
+            elif line.startswith('TO:'):
+                if to is None:
+                    to = line[3:].strip()
+            elif line.startswith('SUBJECT:'):
+                if subject is None:
+                    subject = line[8:].strip()
+            elif line.startswith('CC:'):
+                if cc is None:
+                    cc = line[3:].strip()
+            elif line.startswith('BODY:'):
+                # Keep any body text that starts on the BODY: line itself
+                rest = line[5:].strip()
+                body_lines = [rest] if rest else []
         
-        if not to_match or not subject_match or not body_match:
+        body = "\n".join(body_lines).strip() if body_lines is not None else ""
+        if not to or not subject or not body:
             return "⚠️ Could not parse email format", response_text
+        cc = cc or ""
         
-        to = to_match.group(1).strip()
-        subject = subject_match.group(1).strip()
-        cc = cc_match.group(1).strip() if cc_match else ""
-        body = body_match.group(1).strip()
+        if send_email is None or send_email_with_cc is None:
+            return "⚠️ email_config not available", response_text
         
         # Create a clean summary - strip HTML tags for readable display
-        import html
-        body_clean = re.sub(r'<[^>]+>', ' ', body)  # Remove HTML tags
+        body_clean = _HTML_TAG_RE.sub(' ', body)  # Remove HTML tags
         body_clean = html.unescape(body_clean)  # Decode HTML entities
-        body_clean = re.sub(r' +', ' ', body_clean)  # Normalize spaces
-        body_clean = re.sub(r'\n\s*\n', '\n\n', body_clean.strip())  # Clean up newlines
+        body_clean = _MULTI_SPACE_RE.sub(' ', body_clean)  # Normalize spaces
+        body_clean = _BLANK_LINES_RE.sub('\n\n', body_clean.strip())  # Clean up newlines
         
         # Check if this looks like a report (for PDF generation)
         is_report = any(keyword in body.lower() or keyword in subject.lower() 
@@ -382,7 +694,7 @@ Current date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
                 if is_pdf_available():
                     # Extract recipient name from email or body
                     recipient_name = ""
-                    name_match = re.search(r'Dear\s+(\w+)', body, re.IGNORECASE)
+                    name_match = _GREETING_NAME_RE.search(body)
                     if name_match:
                         recipient_name = name_match.group(1)
                     
@@ -420,8 +732,6 @@ Current date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
         
         # Send the email
         try:
-            from email_config import send_email, send_email_with_cc
-            
             # Prepare attachments if PDF was generated
             attachments = None
             if pdf_path:
@@ -436,7 +746,6 @@ Current date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
             # Clean up temp PDF file
             if pdf_path:
                 try:
-                    import os
                     os.remove(pdf_path)
                 except:
                     pass
@@ -449,7 +758,7 @@ Current date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
             logger.error(f"Failed to send email: {e}")
             return f"❌ Failed to send email: {str(e)}", clean_summary
     
-    async def _handle_tool_calls(self, run: ThreadRun, thread_id: str):
+    async def _handle_tool_calls(self, run: ThreadRun, thread_id: str, client: AgentsClient):
         """Handle tool calls during agent execution."""
         if not hasattr(run, 'required_action') or not run.required_action:
             return
@@ -464,21 +773,14 @@ Current date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
             if not tool_calls:
                 return
             
-            tool_outputs = []
-            for tool_call in tool_calls:
-                # For built-in tools (Bing, file search), return empty output
-                tool_outputs.append({
-                    "tool_call_id": tool_call.id,
-                    "output": "{}"
-                })
-            
-            client = self._get_client()
+            # For built-in tools (Bing, file search), return empty output
             formatted_outputs = [
-                ToolOutput(tool_call_id=o["tool_call_id"], output=o["output"])
-                for o in tool_outputs
+                ToolOutput(tool_call_id=tool_call.id, output="{}")
+                for tool_call in tool_calls
             ]
             
-            client.runs.submit_tool_outputs(
+            await asyncio.to_thread(
+                client.runs.submit_tool_outputs,
                 thread_id=thread_id,
                 run_id=run.id,
                 tool_outputs=formatted_outputs
@@ -2,6 +2,7 @@
 Twilio SMS Agent - A2A Remote Agent for sending SMS messages via Azure AI Foundry.
 """
 import asyncio
+import contextlib
 import logging
 import os
 import threading
@@ -9,6 +10,7 @@ import threading
 import click
 import uvicorn
 
+from foundry_agent import close_azure_clients
 from foundry_agent_executor import create_foundry_agent_executor, initialize_foundry_twilio_agents_at_startup
 from dotenv import load_dotenv
 from starlette.applications import Starlette
@@ -163,8 +165,14 @@ def create_a2a_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
         )
     )
 
+    @contextlib.asynccontextmanager
+    async def lifespan(_: Starlette):
+        yield
+        # Close the server loop's shared Azure clients so their HTTP session shuts down cleanly
+        await close_azure_clients()
+
     # Create Starlette app
-    app = Starlette(routes=routes)
+    app = Starlette(routes=routes, lifespan=lifespan)
     
     return app, agent_card
 
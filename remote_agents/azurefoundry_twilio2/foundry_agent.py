@@ -9,24 +9,339 @@ import os
 import time
 import datetime
 import asyncio
+import functools
 import logging
 import json
+import random
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Optional, Dict, List
 
-from azure.ai.agents import AgentsClient
+import aiohttp
+from azure.ai.agents.aio import AgentsClient
 from azure.ai.agents.models import (
     Agent, ThreadMessage, ThreadRun, AgentThread, ToolOutput, 
-    ListSortOrder, FunctionTool, ToolSet
+    ListSortOrder, FunctionTool, ToolSet,
+    AgentStreamEvent, MessageDeltaChunk, RunStep, SubmitToolOutputsAction
 )
-from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
+from azure.ai.projects.aio import AIProjectClient
+from azure.core.credentials_async import AsyncTokenCredential
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.identity.aio import (
+    ChainedTokenCredential, DefaultAzureCredential, EnvironmentCredential, ManagedIdentityCredential
+)
+
+import requests
+from requests.adapters import HTTPAdapter
 
 # Twilio imports
 from twilio.rest import Client as TwilioClient
 from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 
 logger = logging.getLogger(__name__)
 
+# Guards the process-wide client registries below
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _build_pooled_session(pool_connections: int, pool_maxsize: int) -> requests.Session:
+    """Create a keep-alive requests session with explicit connection pool limits."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Shared Twilio HTTP client so SMS calls reuse kept-alive connections to api.twilio.com
+_TWILIO_HTTP_CLIENT: Optional[TwilioHttpClient] = None
+
+
+def _get_twilio_http_client() -> TwilioHttpClient:
+    """Get the shared pooled Twilio HTTP client, creating it on first use."""
+    global _TWILIO_HTTP_CLIENT
+    with _CLIENTS_LOCK:
+        if _TWILIO_HTTP_CLIENT is None:
+            http_client = TwilioHttpClient(pool_connections=True, timeout=30)
+            http_client.session = _build_pooled_session(pool_connections=20, pool_maxsize=100)
+            _TWILIO_HTTP_CLIENT = http_client
+        return _TWILIO_HTTP_CLIENT
+
+
+def _build_credential() -> AsyncTokenCredential:
+    """Build a credential chain trimmed to the environment we're running in.
+    
+    In production only managed identity and environment (service principal) credentials can
+    succeed, so skip probing the rest of the DefaultAzureCredential chain on every token refresh.
+    """
+    if os.getenv("ENVIRONMENT", "").lower() in ("production", "prod"):
+        logger.info("Using managed identity / environment credential chain")
+        return ChainedTokenCredential(
+            ManagedIdentityCredential(client_id=os.getenv("AZURE_CLIENT_ID")),
+            EnvironmentCredential(),
+        )
+    # Local development: keep Azure CLI (az login) but skip the IDE probe
+    # (the async chain has no interactive browser credential)
+    return DefaultAzureCredential(exclude_visual_studio_code_credential=True)
+
+
+class _AzureClients:
+    """Async Azure credential and SDK clients (keyed by project endpoint) for one event loop.
+    
+    aiohttp sessions are bound to the loop that created them and startup runs on a different
+    loop than the server, so each loop gets its own set. Agents on the same loop share it so
+    token caching and connection pools survive across agents.
+    """
+    
+    def __init__(self):
+        self.credential = _build_credential()
+        # One HTTP session for both SDK clients so TCP/TLS connections are reused between them.
+        # session_owner=False keeps it open when a client is closed; close() closes it last.
+        # Settings mirror azure-core's own session (proxy env vars honoured, no shared cookies)
+        # plus explicit pool limits.
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, limit_per_host=100),
+            trust_env=True,
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        self.transport = AioHttpTransport(session=self.session, session_owner=False)
+        self.project_clients: Dict[str, AIProjectClient] = {}
+        self.agents_clients: Dict[str, AgentsClient] = {}
+    
+    async def close(self) -> None:
+        for client in (*self.agents_clients.values(), *self.project_clients.values()):
+            await client.close()
+        await self.credential.close()
+        await self.session.close()
+
+
+# Entries are only removed by close_azure_clients(), which each loop must call before it shuts down
+_LOOP_CLIENTS: Dict[asyncio.AbstractEventLoop, _AzureClients] = {}
+
+
+def _azure_clients() -> _AzureClients:
+    """Get the Azure clients for the running event loop, creating them on first use."""
+    loop = asyncio.get_running_loop()
+    with _CLIENTS_LOCK:
+        clients = _LOOP_CLIENTS.get(loop)
+        if clients is None:
+            clients = _LOOP_CLIENTS[loop] = _AzureClients()
+        return clients
+
+
+async def close_azure_clients() -> None:
+    """Close the running loop's Azure clients; later calls on this loop create new ones."""
+    with _CLIENTS_LOCK:
+        clients = _LOOP_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if clients is not None:
+        await clients.close()
+
+
+# Function tool definition for send_sms; the SDK does not mutate it, so one shared dict is enough
+_SEND_SMS_TOOL_DEF = {
+    "type": "function",
+    "function": {
+        "name": "send_sms",
+        "description": """Send an SMS text message via Twilio to notify a user.
+                
+Use this function to:
+- Send workflow results or summaries to a user's phone
+- Deliver notifications or alerts via SMS
+- Confirm completed actions with a text message
+
+The message should be clear and concise since SMS has character limits.
+If no phone number is provided, the default configured number will be used.""",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "message": {
+                    "type": "string",
+                    "description": "The SMS message content to send. Should be concise and informative. Max ~1600 characters."
+                },
+                "to_number": {
+                    "type": "string",
+                    "description": "Optional recipient phone number in E.164 format (e.g., +15147715943). If not provided, uses the default configured number."
+                }
+            },
+            "required": ["message"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Agent instructions; only the timestamp is filled in per agent
+_INSTRUCTIONS_TEMPLATE = """You are an SMS notification agent powered by Azure AI Foundry and Twilio.
+
+## Your Purpose
+You send SMS text messages to users. You are typically used as the final step in a multi-agent workflow to deliver results, confirmations, or notifications to users' phones.
+
+## Your Capabilities
+You have ONE tool available:
+- **send_sms**: Send an SMS message to a phone number
+
+## CRITICAL: How to Process Requests
+
+1. **Extract the message content from the user's request**: The user will provide text that needs to be sent as an SMS. You MUST extract this content.
+2. **Compose a clear, concise SMS from that content**: Adapt it for SMS format (brief and to the point)
+3. **Call the send_sms function with the message parameter**: The `message` parameter is REQUIRED and must contain the actual text to send.
+
+## IMPORTANT: The `message` parameter MUST NOT be empty!
+
+When calling send_sms, you MUST provide a non-empty `message` parameter. Example:
+- ✅ CORRECT: send_sms(message="Your balance is $500. Thanks for checking!", to_number="+15551234567")
+- ❌ WRONG: send_sms(message="", to_number="+15551234567")
+
+If the user says "Send an SMS saying hello", you should call: send_sms(message="Hello!")
+
+## Message Formatting Guidelines
+
+Since SMS has character limits (~160 chars per segment, max ~1600 chars total):
+- Be concise and direct
+- Remove unnecessary formatting (no markdown, headers, or bullets)
+- Focus on the key information
+- If the original content is long, summarize it appropriately
+
+## After Sending
+
+Reply with a brief confirmation: recipient, status and Twilio message SID. If the SMS fails, explain the error and suggest alternatives.
+
+Current date and time: {now}
+
+Remember: Your job is to SEND the SMS, not just describe what you would send. Always call the send_sms function!
+"""
+
+# Completion token cap per run: enough for a full 1600-character send_sms call plus the
+# confirmation, while stopping runaway generations
+_MAX_COMPLETION_TOKENS = 800
+
+# Polling fallback: run states that still need polling, and the wall-clock budget for a run
+_ACTIVE_RUN_STATUSES = frozenset({"queued", "in_progress", "requires_action"})
+_RUN_TIMEOUT_SECONDS = 30.0
+
+# Bounds on the per-agent thread registry; evicted threads are deleted from Azure
+_MAX_TRACKED_THREADS = 1024
+_THREAD_TTL_SECONDS = 3600
+
+# Twilio rejects message bodies longer than 1600 UTF-16 code units
+_SMS_MAX_UNITS = 1600
+
+
+def _continues_grapheme(ch: str) -> bool:
+    """Whether ch attaches to the preceding character (combining mark, joiner, variation selector, skin tone)."""
+    return (
+        unicodedata.combining(ch) != 0
+        or ch in ("\u200d", "\ufe0e", "\ufe0f")
+        or 0x1F3FB <= ord(ch) <= 0x1F3FF
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _fit_sms_body(message: str) -> str:
+    """Truncate a message to Twilio's body limit without splitting a character sequence.
+    
+    Twilio counts UTF-16 code units, so characters outside the BMP (most emoji) take two.
+    """
+    # Every code point is at most two units, so short or pure-ASCII bodies can't exceed the limit
+    if len(message) <= _SMS_MAX_UNITS // 2 or (message.isascii() and len(message) <= _SMS_MAX_UNITS):
+        return message
+    if len(message.encode("utf-16-le")) // 2 <= _SMS_MAX_UNITS:
+        return message
+    
+    budget = _SMS_MAX_UNITS - 3  # room for the "..." suffix
+    end = used = 0
+    for ch in message:
+        width = 2 if ord(ch) > 0xFFFF else 1
+        if used + width > budget:
+            break
+        used += width
+        end += 1
+    # Back up to the start of the character sequence the cut landed in
+    while end > 0 and (_continues_grapheme(message[end]) or message[end - 1] == "\u200d"):
+        end -= 1
+    return message[:end] + "..."
+
+
+# Pre-serialized tool outputs for the fixed error cases
+_EMPTY_MESSAGE_OUTPUT = json.dumps({
+    "success": False,
+    "error": "Message body is empty. The AI model did not extract the message content properly."
+})
+_UNKNOWN_FN_TEMPLATE = '{"error": "Unknown function: %s"}'  # %s must be JSON-string-escaped
+
+# Attempts per SMS when Twilio answers with 429 / error 20429 (Too Many Requests)
+_SMS_MAX_ATTEMPTS = 3
+
+
+def _sms_send_rate(from_number: str) -> float:
+    """Messages per second Twilio accepts from a sender.
+    
+    Long codes are limited to ~1 MPS; short codes and WhatsApp senders allow ~25 MPS.
+    """
+    if from_number.startswith("whatsapp:"):
+        return 25.0
+    digits = from_number.lstrip("+")
+    if digits.isdigit() and len(digits) <= 6:
+        return 25.0
+    return 1.0
+
+
+def _retry_after_seconds(error: TwilioRestException, default: float) -> float:
+    """Read a Retry-After hint from a Twilio error when one is available."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", default))
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True, slots=True)
+class TwilioConfig:
+    """Twilio settings resolved once from the environment."""
+    account_sid: str
+    auth_token: str
+    from_number: str
+    default_to: Optional[str] = None
+    
+    @classmethod
+    def from_env(cls) -> "Optional[TwilioConfig]":
+        """Build the config from TWILIO_* env vars, or None if a required one is missing."""
+        account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
+        auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
+        from_number = os.environ.get("TWILIO_FROM_NUMBER")
+        if not (account_sid and auth_token and from_number):
+            return None
+        return cls(
+            account_sid=account_sid,
+            auth_token=auth_token,
+            from_number=from_number,
+            default_to=os.environ.get("TWILIO_DEFAULT_TO_NUMBER"),
+        )
+
+
+class _TokenBucket:
+    """Async token bucket: allows ``rate`` acquisitions per second with bursts up to ``capacity``."""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
 
 class FoundryTwilioAgent:
     """
@@ -38,62 +353,78 @@ class FoundryTwilioAgent:
     
     def __init__(self):
         self.endpoint = os.environ["AZURE_AI_FOUNDRY_PROJECT_ENDPOINT"]
-        self.credential = DefaultAzureCredential()
         self.agent: Optional[Agent] = None
-        self.threads: Dict[str, str] = {}
-        self._agents_client = None
-        self._project_client = None
+        # thread_id -> last used (monotonic); least recently used first
+        self.threads: "OrderedDict[str, float]" = OrderedDict()
+        self._background_tasks: set = set()
         self._twilio_client = None
         self.last_token_usage: Optional[Dict[str, int]] = None
+        # Caps concurrent tool executions (and so concurrent Twilio sends) per agent
+        self._tool_sem = asyncio.Semaphore(8)
+        # Per-sender send-rate limiters, see _sms_send_rate
+        self._rate_buckets: Dict[str, _TokenBucket] = {}
         
-        # Twilio configuration
-        self.twilio_account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
-        self.twilio_auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
-        self.twilio_from_number = os.environ.get("TWILIO_FROM_NUMBER")
-        self.twilio_default_to_number = os.environ.get("TWILIO_DEFAULT_TO_NUMBER")
+        # Twilio configuration (None if incomplete)
+        self._twilio_cfg: Optional[TwilioConfig] = TwilioConfig.from_env()
         
     def _get_client(self) -> AgentsClient:
-        """Get a cached AgentsClient instance."""
-        if self._agents_client is None:
-            self._agents_client = AgentsClient(
+        """Get the shared AgentsClient for this endpoint on the running loop."""
+        clients = _azure_clients()
+        client = clients.agents_clients.get(self.endpoint)
+        if client is None:
+            client = clients.agents_clients[self.endpoint] = AgentsClient(
                 endpoint=self.endpoint,
-                credential=self.credential,
+                credential=clients.credential,
+                transport=clients.transport,
             )
-        return self._agents_client
+        return client
         
     def _get_project_client(self) -> AIProjectClient:
-        """Get a cached AIProjectClient instance."""
-        if self._project_client is None:
-            self._project_client = AIProjectClient(
+        """Get the shared AIProjectClient for this endpoint on the running loop."""
+        clients = _azure_clients()
+        client = clients.project_clients.get(self.endpoint)
+        if client is None:
+            client = clients.project_clients[self.endpoint] = AIProjectClient(
                 endpoint=self.endpoint,
-                credential=self.credential,
+                credential=clients.credential,
+                transport=clients.transport,
             )
-        return self._project_client
+        return client
     
     def _get_twilio_client(self) -> TwilioClient:
         """Get a cached Twilio client instance."""
         if self._twilio_client is None:
-            if not self.twilio_account_sid or not self.twilio_auth_token:
-                raise ValueError("Twilio credentials not configured. Set TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN")
-            self._twilio_client = TwilioClient(self.twilio_account_sid, self.twilio_auth_token)
+            cfg = self._twilio_cfg
+            if cfg is None:
+                raise ValueError("Twilio configuration is incomplete. Set TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN and TWILIO_FROM_NUMBER")
+            self._twilio_client = TwilioClient(
+                cfg.account_sid,
+                cfg.auth_token,
+                http_client=_get_twilio_http_client()
+            )
         return self._twilio_client
     
+    def _get_rate_bucket(self, from_number: str) -> "_TokenBucket":
+        """Get the send-rate limiter for a sender number."""
+        bucket = self._rate_buckets.get(from_number)
+        if bucket is None:
+            rate = _sms_send_rate(from_number)
+            bucket = self._rate_buckets[from_number] = _TokenBucket(rate=rate, capacity=1)
+        return bucket
+    
     def _validate_twilio_config(self) -> bool:
         """Validate Twilio configuration."""
-        missing = []
-        if not self.twilio_account_sid:
-            missing.append("TWILIO_ACCOUNT_SID")
-        if not self.twilio_auth_token:
-            missing.append("TWILIO_AUTH_TOKEN")
-        if not self.twilio_from_number:
-            missing.append("TWILIO_FROM_NUMBER")
-        
-        if missing:
-            logger.error(f"Missing Twilio configuration: {', '.join(missing)}")
-            return False
-        return True
+        if self._twilio_cfg is not None:
+            return True
+        # Only reached on the failure path, so re-reading the environment here is fine
+        missing = [
+            name for name in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_FROM_NUMBER")
+            if not os.environ.get(name)
+        ]
+        logger.error(f"Missing Twilio configuration: {', '.join(missing)}")
+        return False
     
-    def send_sms(self, message: str, to_number: Optional[str] = None) -> Dict:
+    async def send_sms(self, message: str, to_number: Optional[str] = None) -> Dict:
         """
         Send an SMS message via Twilio.
         
@@ -106,7 +437,8 @@ class FoundryTwilioAgent:
         """
         try:
             client = self._get_twilio_client()
-            recipient = to_number or self.twilio_default_to_number
+            cfg = self._twilio_cfg
+            recipient = to_number or cfg.default_to
             
             if not recipient:
                 return {
@@ -115,37 +447,53 @@ class FoundryTwilioAgent:
                 }
             
             # Truncate message if too long for SMS (160 chars for single SMS)
-            if len(message) > 1600:
-                message = message[:1597] + "..."
+            fitted = _fit_sms_body(message)
+            if fitted != message:
+                message = fitted
                 logger.warning("Message truncated to 1600 characters for SMS")
             
-            msg = client.messages.create(
-                body=message,
-                from_=self.twilio_from_number,
-                to=recipient
-            )
+            bucket = self._get_rate_bucket(cfg.from_number)
+            for attempt in range(_SMS_MAX_ATTEMPTS):
+                # Pace sends to the sender's throughput limit instead of letting Twilio reject them
+                await bucket.acquire()
+                try:
+                    # The Twilio REST client is blocking; keep the event loop free during the round trip
+                    msg = await asyncio.to_thread(
+                        client.messages.create,
+                        body=message,
+                        from_=cfg.from_number,
+                        to=recipient
+                    )
+                    break
+                except TwilioRestException as e:
+                    throttled = e.code == 20429 or e.status == 429
+                    if not throttled or attempt == _SMS_MAX_ATTEMPTS - 1:
+                        raise
+                    retry_after = _retry_after_seconds(e, default=2 ** attempt)
+                    logger.warning("Twilio throttled SMS send, retrying in %ss", retry_after)
+                    await asyncio.sleep(retry_after)
             
             result = {
                 "success": True,
                 "message_sid": msg.sid,
-                "from": self.twilio_from_number,
+                "from": cfg.from_number,
                 "to": recipient,
                 "status": msg.status,
                 "body_length": len(message)
             }
             
-            logger.info(f"✅ SMS sent successfully: SID={msg.sid}, To={recipient}")
+            logger.info("✅ SMS sent successfully: SID=%s, To=%s", msg.sid, recipient)
             return result
             
         except TwilioRestException as e:
-            logger.error(f"❌ Twilio API error: {e}")
+            logger.error("❌ Twilio API error: %s", e)
             return {
                 "success": False,
                 "error": str(e),
                 "error_code": e.code if hasattr(e, 'code') else None
             }
         except Exception as e:
-            logger.error(f"❌ Unexpected error sending SMS: {e}")
+            logger.error("❌ Unexpected error sending SMS: %s", e)
             return {
                 "success": False,
                 "error": str(e)
@@ -153,36 +501,7 @@ class FoundryTwilioAgent:
     
     def _get_send_sms_tool_definition(self) -> Dict:
         """Get the function tool definition for send_sms."""
-        return {
-            "type": "function",
-            "function": {
-                "name": "send_sms",
-                "description": """Send an SMS text message via Twilio to notify a user.
-                
-Use this function to:
-- Send workflow results or summaries to a user's phone
-- Deliver notifications or alerts via SMS
-- Confirm completed actions with a text message
-
-The message should be clear and concise since SMS has character limits.
-If no phone number is provided, the default configured number will be used.""",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "message": {
-                            "type": "string",
-                            "description": "The SMS message content to send. Should be concise and informative. Max ~1600 characters."
-                        },
-                        "to_number": {
-                            "type": "string",
-                            "description": "Optional recipient phone number in E.164 format (e.g., +15147715943). If not provided, uses the default configured number."
-                        }
-                    },
-                    "required": ["message"],
-                    "additionalProperties": False
-                }
-            }
-        }
+        return _SEND_SMS_TOOL_DEF
         
     async def create_agent(self) -> Agent:
         """Create the AI Foundry agent with SMS sending capabilities."""
@@ -200,124 +519,113 @@ If no phone number is provided, the default configured number will be used.""",
         tools.append(self._get_send_sms_tool_definition())
         logger.info("Added send_sms function tool")
         
-        project_client = self._get_project_client()
-        
-        with project_client:
-            self.agent = project_client.agents.create_agent(
-                model=os.getenv("AZURE_AI_AGENT_MODEL_DEPLOYMENT_NAME", "gpt-4o"),
-                name="foundry-twilio-sms-agent",
-                instructions=self._get_agent_instructions(),
-                tools=tools
-            )
+        # The project client is shared per event loop; leave it open so later calls reuse its connections
+        self.agent = await self._get_project_client().agents.create_agent(
+            model=os.getenv("AZURE_AI_AGENT_MODEL_DEPLOYMENT_NAME", "gpt-4o"),
+            name="foundry-twilio-sms-agent",
+            instructions=self._get_agent_instructions(),
+            tools=tools
+        )
         
         logger.info(f"✅ Created Twilio SMS agent: {self.agent.id}")
         return self.agent
     
     def _get_agent_instructions(self) -> str:
         """Get the agent instructions for SMS messaging."""
-        return f"""You are an SMS notification agent powered by Azure AI Foundry and Twilio.
-
-## Your Purpose
-You send SMS text messages to users. You are typically used as the final step in a multi-agent workflow to deliver results, confirmations, or notifications to users' phones.
-
-## Your Capabilities
-You have ONE tool available:
-- **send_sms**: Send an SMS message to a phone number
-
-## CRITICAL: How to Process Requests
-
-1. **Extract the message content from the user's request**: The user will provide text that needs to be sent as an SMS. You MUST extract this content.
-2. **Compose a clear, concise SMS from that content**: Adapt it for SMS format (brief and to the point)
-3. **Call the send_sms function with the message parameter**: The `message` parameter is REQUIRED and must contain the actual text to send.
-
-## IMPORTANT: The `message` parameter MUST NOT be empty!
-
-When calling send_sms, you MUST provide a non-empty `message` parameter. Example:
-- ✅ CORRECT: send_sms(message="Your balance is $500. Thanks for checking!", to_number="+15551234567")
-- ❌ WRONG: send_sms(message="", to_number="+15551234567")
-
-If the user says "Send an SMS saying hello", you should call: send_sms(message="Hello!")
-
-## Message Formatting Guidelines
-
-Since SMS has character limits (~160 chars per segment, max ~1600 chars total):
-- Be concise and direct
-- Remove unnecessary formatting (no markdown, headers, or bullets)
-- Focus on the key information
-- If the original content is long, summarize it appropriately
-
-## Examples of Good SMS Messages
-
-For a balance inquiry result:
-"Your Stripe balance: $1,234.56 (Available: $1,000.00, Pending: $234.56). As of Feb 2, 2026."
-
-For a workflow completion:
-"Task completed! Your document has been processed and sent to the review team. Reference: #12345"
-
-For an alert:
-"ALERT: Unusual activity detected on your account. Please review your recent transactions."
-
-## Response Format
-
-After sending an SMS, provide a brief confirmation:
-```
-📱 SMS SENT SUCCESSFULLY
-
-**To**: [phone number]
-**Message**: [content preview]
-**Status**: [delivered/queued]
-**Message SID**: [Twilio message ID]
-```
-
-If the SMS fails, explain the error and suggest alternatives.
-
-Current date and time: {datetime.datetime.now().isoformat()}
-
-Remember: Your job is to SEND the SMS, not just describe what you would send. Always call the send_sms function!
-"""
+        return _INSTRUCTIONS_TEMPLATE.format(now=datetime.datetime.now().isoformat())
 
     async def create_thread(self, thread_id: Optional[str] = None) -> AgentThread:
         """Create or retrieve a conversation thread."""
         if thread_id and thread_id in self.threads:
-            pass
+            self._touch_thread(thread_id)
+            return AgentThread(id=thread_id)
             
         client = self._get_client()
-        thread = client.threads.create()
-        self.threads[thread.id] = thread.id
-        logger.info(f"Created thread: {thread.id}")
+        thread = await client.threads.create()
+        self._touch_thread(thread.id)
+        logger.info("Created thread: %s", thread.id)
+        self._evict_threads()
         return thread
     
+    def _touch_thread(self, thread_id: str) -> None:
+        """Mark a tracked thread as most recently used."""
+        self.threads[thread_id] = time.monotonic()
+        self.threads.move_to_end(thread_id)
+    
+    def _evict_threads(self) -> None:
+        """Stop tracking expired or least recently used threads and delete them from Azure in the background."""
+        cutoff = time.monotonic() - _THREAD_TTL_SECONDS
+        evicted = []
+        while self.threads:
+            oldest_id, last_used = next(iter(self.threads.items()))
+            if len(self.threads) <= _MAX_TRACKED_THREADS and last_used >= cutoff:
+                break
+            self.threads.popitem(last=False)
+            evicted.append(oldest_id)
+        if not evicted:
+            return
+        
+        client = self._get_client()
+        
+        async def _delete():
+            for evicted_id in evicted:
+                try:
+                    await client.threads.delete(evicted_id)
+                except Exception as e:
+                    logger.debug(f"Could not delete evicted thread {evicted_id}: {e}")
+        
+        logger.info(f"Evicting {len(evicted)} idle threads")
+        task = asyncio.ensure_future(_delete())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
     async def send_message(self, thread_id: str, content: str, role: str = "user") -> ThreadMessage:
         """Send a message to the conversation thread."""
         client = self._get_client()
-        message = client.messages.create(
+        message = await client.messages.create(
             thread_id=thread_id,
             role=role,
             content=content
         )
-        logger.info(f"Created message in thread {thread_id}: {message.id}")
+        logger.info("Created message in thread %s: %s", thread_id, message.id)
         return message
     
-    async def _handle_tool_calls(self, run: ThreadRun, thread_id: str):
-        """Handle function tool calls from the agent."""
-        client = self._get_client()
-        
+    async def _execute_tool_calls(self, run: ThreadRun) -> List[ToolOutput]:
+        """Execute the function tool calls a run is waiting on and return their outputs."""
         if not hasattr(run, 'required_action') or not run.required_action:
             logger.warning("No required_action found in run")
-            return
+            return []
         
         if not hasattr(run.required_action, 'submit_tool_outputs'):
             logger.warning("No submit_tool_outputs in required_action")
-            return
+            return []
         
         tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        
+        # Run the calls concurrently; every call still needs an output, so failures become error payloads
+        results = await asyncio.gather(
+            *[self._run_one_tool(tool_call) for tool_call in tool_calls],
+            return_exceptions=True
+        )
         tool_outputs = []
+        for tool_call, result in zip(tool_calls, results):
+            if isinstance(result, BaseException):
+                logger.error("❌ Tool call %s failed: %s", tool_call.id, result)
+                result = ToolOutput(
+                    tool_call_id=tool_call.id,
+                    output=json.dumps({"success": False, "error": str(result)})
+                )
+            tool_outputs.append(result)
         
-        for tool_call in tool_calls:
+        return tool_outputs
+    
+    async def _run_one_tool(self, tool_call) -> ToolOutput:
+        """Execute a single function tool call."""
+        async with self._tool_sem:
             function_name = tool_call.function.name
             function_args = json.loads(tool_call.function.arguments)
             
-            logger.info(f"🔧 Executing function: {function_name} with args: {function_args}")
+            logger.info("🔧 Executing function: %s with args: %s", function_name, function_args)
             
             if function_name == "send_sms":
                 # Get the message from args
@@ -325,99 +633,228 @@ Remember: Your job is to SEND the SMS, not just describe what you would send. Al
                 
                 # Guard against empty messages
                 if not sms_message or not sms_message.strip():
-                    logger.error(f"❌ Empty message received from AI model. Full args: {function_args}")
-                    result = {
-                        "success": False,
-                        "error": "Message body is empty. The AI model did not extract the message content properly."
-                    }
-                else:
-                    # Execute the send_sms function
-                    result = self.send_sms(
-                        message=sms_message,
-                        to_number=function_args.get("to_number")
-                    )
-                tool_outputs.append(ToolOutput(
+                    logger.error("❌ Empty message received from AI model. Full args: %s", function_args)
+                    return ToolOutput(tool_call_id=tool_call.id, output=_EMPTY_MESSAGE_OUTPUT)
+                
+                # Execute the send_sms function
+                result = await self.send_sms(
+                    message=sms_message,
+                    to_number=function_args.get("to_number")
+                )
+                logger.info("📱 SMS function result: %s", result)
+                return ToolOutput(
                     tool_call_id=tool_call.id,
                     output=json.dumps(result)
-                ))
-                logger.info(f"📱 SMS function result: {result}")
-            else:
-                # Unknown function
-                tool_outputs.append(ToolOutput(
-                    tool_call_id=tool_call.id,
-                    output=json.dumps({"error": f"Unknown function: {function_name}"})
-                ))
+                )
+            
+            # Unknown function
+            return ToolOutput(
+                tool_call_id=tool_call.id,
+                output=_UNKNOWN_FN_TEMPLATE % json.dumps(function_name)[1:-1]
+            )
+    
+    async def _handle_tool_calls(self, run: ThreadRun, thread_id: str):
+        """Handle function tool calls from the agent."""
+        client = self._get_client()
+        tool_outputs = await self._execute_tool_calls(run)
         
         # Submit tool outputs
         if tool_outputs:
-            client.runs.submit_tool_outputs(
+            await client.runs.submit_tool_outputs(
                 thread_id=thread_id,
                 run_id=run.id,
                 tool_outputs=tool_outputs
             )
-            logger.info(f"Submitted {len(tool_outputs)} tool outputs")
+            logger.info("Submitted %d tool outputs", len(tool_outputs))
+    
+    @staticmethod
+    def _tool_call_labels(run_step, tool_calls_yielded: set) -> List[str]:
+        """Progress labels for tool calls in a run step that haven't been announced yet."""
+        labels = []
+        if (hasattr(run_step, "step_details") and
+            hasattr(run_step.step_details, "type") and
+            run_step.step_details.type == "tool_calls" and
+            hasattr(run_step.step_details, "tool_calls")):
+            for tool_call in run_step.step_details.tool_calls:
+                if tool_call and hasattr(tool_call, "type"):
+                    # Keyed by id so repeated calls of the same tool type are each announced
+                    tool_key = getattr(tool_call, "id", None) or tool_call.type
+                    if tool_key not in tool_calls_yielded:
+                        if hasattr(tool_call, 'function') and hasattr(tool_call.function, 'name'):
+                            labels.append(f"🛠️ Calling function: {tool_call.function.name}")
+                        else:
+                            labels.append(f"🛠️ Executing tool: {tool_call.type}")
+                        tool_calls_yielded.add(tool_key)
+        return labels
+    
+    async def _stream_run(self, client: AgentsClient, thread_id: str):
+        """Consume a run's event stream.
+        
+        Yields ``("progress", label)`` for each newly seen tool call, ``("run", run, stream)``
+        for each run status update, then ``("done", run, text)`` with the final run and the
+        assembled assistant text. On a ``requires_action`` update the caller executes the tool
+        calls and submits their outputs on ``stream`` before resuming iteration.
+        """
+        run = None
+        message_id = None
+        text_parts: List[str] = []
+        tool_calls_yielded = set()
+        
+        async with await client.runs.stream(
+            thread_id=thread_id,
+            agent_id=self.agent.id,
+            max_completion_tokens=_MAX_COMPLETION_TOKENS,
+            temperature=0,
+        ) as stream:
+            async for event_type, event_data, _ in stream:
+                if isinstance(event_data, RunStep):
+                    for label in self._tool_call_labels(event_data, tool_calls_yielded):
+                        yield "progress", label
+                elif isinstance(event_data, MessageDeltaChunk):
+                    # Only keep the text of the most recent assistant message
+                    if event_data.id != message_id:
+                        message_id = event_data.id
+                        text_parts = []
+                    text_parts.append(event_data.text)
+                elif isinstance(event_data, ThreadRun):
+                    run = event_data
+                    yield "run", run, stream
+                elif event_type == AgentStreamEvent.ERROR:
+                    raise RuntimeError(f"Stream error: {event_data}")
+        
+        yield "done", run, "".join(text_parts) if message_id else None
     
     async def run_conversation_stream(self, thread_id: str, user_message: str):
         """Async generator: yields progress messages and final response."""
         if not self.agent:
             await self.create_agent()
 
+        if thread_id in self.threads:
+            self._touch_thread(thread_id)
         await self.send_message(thread_id, user_message)
         client = self._get_client()
-        run = client.runs.create(thread_id=thread_id, agent_id=self.agent.id)
-
-        max_iterations = 25
-        iterations = 0
-        tool_calls_yielded = set()
-
-        while run.status in ["queued", "in_progress", "requires_action"] and iterations < max_iterations:
-            iterations += 1
-            await asyncio.sleep(2)
-            
-            # Check for tool calls in progress
-            try:
-                run_steps = client.run_steps.list(thread_id, run.id)
-                for run_step in run_steps:
-                    if (hasattr(run_step, "step_details") and
-                        hasattr(run_step.step_details, "type") and
-                        run_step.step_details.type == "tool_calls" and
-                        hasattr(run_step.step_details, "tool_calls")):
-                        for tool_call in run_step.step_details.tool_calls:
-                            if tool_call and hasattr(tool_call, "type"):
-                                tool_type = tool_call.type
-                                if tool_type not in tool_calls_yielded:
-                                    if hasattr(tool_call, 'function') and hasattr(tool_call.function, 'name'):
-                                        yield f"🛠️ Calling function: {tool_call.function.name}"
-                                    else:
-                                        yield f"🛠️ Executing tool: {tool_type}"
-                                    tool_calls_yielded.add(tool_type)
-            except Exception:
-                pass
-
+        response_text = None
+
+        if hasattr(client.runs, "stream"):
+            # Drive the run off streamed events rather than polling runs.get/run_steps.list
+            run = None
+            events = self._stream_run(client, thread_id)
+            # Same wall-clock budget as polling; checked per event so it never spans our own yields
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + _RUN_TIMEOUT_SECONDS
             try:
-                run = client.runs.get(thread_id=thread_id, run_id=run.id)
+                while True:
+                    async with asyncio.timeout_at(deadline):
+                        event = await anext(events, None)
+                    if event is None:
+                        break
+                    kind, *payload = event
+                    if kind == "progress":
+                        yield payload[0]
+                    elif kind == "run":
+                        run, stream = payload
+                        if run.status == "requires_action" and isinstance(run.required_action, SubmitToolOutputsAction):
+                            # Tool calls run outside the deadline and don't count against it: an SMS
+                            # that is being sent must not be abandoned and then retried by the host
+                            started = loop.time()
+                            logger.info("Run %s requires action", run.id)
+                            tool_outputs = await self._execute_tool_calls(run)
+                            # Continue on the same stream once the outputs are accepted
+                            await client.runs.submit_tool_outputs_stream(
+                                thread_id=thread_id,
+                                run_id=run.id,
+                                tool_outputs=tool_outputs,
+                                event_handler=stream
+                            )
+                            logger.info("Submitted %d tool outputs", len(tool_outputs))
+                            deadline += loop.time() - started
+                    else:
+                        run, response_text = payload
+            except TimeoutError:
+                # Don't leave the run queued or in progress on the service
+                if run is not None:
+                    try:
+                        await client.runs.cancel(thread_id=thread_id, run_id=run.id)
+                    except Exception as e:
+                        logger.debug("Could not cancel timed out run %s: %s", run.id, e)
+                yield "Error: Request timed out"
+                return
             except Exception as e:
                 yield f"Error: {str(e)}"
                 return
+            finally:
+                await events.aclose()
 
-            if run.status == "failed":
-                yield f"Error: {run.last_error}"
+            if run is None:
+                yield "Error: Run stream ended without a run status"
                 return
+        else:
+            # Older SDKs without streaming support fall back to polling
+            run = await client.runs.create(
+                thread_id=thread_id,
+                agent_id=self.agent.id,
+                max_completion_tokens=_MAX_COMPLETION_TOKENS,
+                temperature=0,
+            )
+
+            tool_calls_yielded = set()
+            # Stop listing run steps once they've gone quiet or the tool calls have surfaced via requires_action
+            stable_polls = 0
+            skip_run_steps = False
+            # Poll quickly at first and back off to 2s, with jitter so concurrent runs don't poll in lockstep.
+            # The budget is wall-clock so it doesn't depend on the backoff schedule.
+            deadline = time.monotonic() + _RUN_TIMEOUT_SECONDS
+            delay = 0.2
+
+            while run.status in _ACTIVE_RUN_STATUSES:
+                if time.monotonic() > deadline:
+                    yield "Error: Request timed out"
+                    return
+                await asyncio.sleep(delay + random.uniform(0, delay * 0.1))
+                delay = min(delay * 1.5, 2.0)
+                
+                # Check for tool calls in progress (a queued run has no steps yet)
+                if run.status != "queued" and not skip_run_steps:
+                    try:
+                        new_labels = 0
+                        async for run_step in client.run_steps.list(thread_id, run.id):
+                            for label in self._tool_call_labels(run_step, tool_calls_yielded):
+                                new_labels += 1
+                                yield label
+                        stable_polls = 0 if new_labels else stable_polls + 1
+                        if stable_polls >= 2:
+                            skip_run_steps = True
+                    except Exception:
+                        pass
 
-            if run.status == "requires_action":
-                logger.info(f"Run {run.id} requires action")
                 try:
-                    await self._handle_tool_calls(run, thread_id)
+                    run = await client.runs.get(thread_id=thread_id, run_id=run.id)
                 except Exception as e:
-                    yield f"Error handling tool calls: {str(e)}"
+                    yield f"Error: {str(e)}"
                     return
 
+                if run.status == "failed":
+                    yield f"Error: {run.last_error}"
+                    return
+
+                if run.status == "requires_action":
+                    logger.info("Run %s requires action", run.id)
+                    skip_run_steps = True
+                    try:
+                        await self._handle_tool_calls(run, thread_id)
+                    except Exception as e:
+                        yield f"Error handling tool calls: {str(e)}"
+                        return
+                    # Tool outputs usually let the run finish quickly
+                    delay = 0.2
+
         if run.status == "failed":
             yield f"Error: {run.last_error}"
             return
 
-        if iterations >= max_iterations:
-            yield "Error: Request timed out"
+        # max_completion_tokens can stop a run short, possibly before send_sms has completed
+        if run.status == "incomplete":
+            yield f"Error: Run incomplete: {run.incomplete_details}"
             return
 
         # Extract token usage
@@ -428,19 +865,30 @@ Remember: Your job is to SEND the SMS, not just describe what you would send. Al
                 'total_tokens': getattr(run.usage, 'total_tokens', 0)
             }
 
-        # Get the assistant's response
-        messages = list(client.messages.list(thread_id=thread_id, order=ListSortOrder.ASCENDING))
-        for msg in reversed(messages):
-            if msg.role == "assistant" and msg.content:
-                for content_item in msg.content:
-                    if hasattr(content_item, 'text'):
-                        yield content_item.text.value
+        if response_text is not None:
+            yield response_text
+            return
+
+        # Get the assistant's response - newest first from this run only, one message per page
+        msg = None
+        async for m in client.messages.list(
+            thread_id=thread_id, run_id=run.id, order=ListSortOrder.DESCENDING, limit=1
+        ):
+            if m.role == "assistant" and m.content:
+                msg = m
                 break
+        if msg is not None:
+            for content_item in msg.content:
+                if hasattr(content_item, 'text'):
+                    yield content_item.text.value
 
     async def cleanup(self):
-        """Cleanup resources."""
+        """Cleanup resources.
+        
+        Only per-agent state is released; the shared Azure clients stay open for other agents
+        and are closed when their event loop shuts down (see close_azure_clients).
+        """
         logger.info("Cleaning up Twilio SMS Agent")
-        self._agents_client = None
-        self._project_client = None
+        self.agent = None
         self._twilio_client = None
-        self.threads = {}
+        self.threads.clear()
@@ -10,7 +10,7 @@ import tempfile
 import time
 from typing import Optional, Dict, List
 
-from foundry_agent import FoundryTwilioAgent
+from foundry_agent import FoundryTwilioAgent, close_azure_clients
 
 from a2a.server.agent_execution import AgentExecutor
 from a2a.server.agent_execution.context import RequestContext
@@ -314,4 +314,8 @@ async def initialize_foundry_twilio_agents_at_startup():
     """
     Initialize shared Twilio SMS agent resources at application startup.
     """
-    await FoundryTwilioAgentExecutor.initialize_at_startup()
\ No newline at end of file
+    try:
+        await FoundryTwilioAgentExecutor.initialize_at_startup()
+    finally:
+        # Startup runs on its own event loop; close that loop's Azure clients before it goes away
+        await close_azure_clients()
\ No newline at end of file
@@ -4,12 +4,27 @@ Test script to diagnose QuickBooks MCP server issues.
 This will help identify why Azure AI Foundry is getting 405 errors.
 """
 
+import httpx
+import io
 import json
-import requests
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 MCP_SERVER_URL = "https://mcp-quickbooks.ambitioussky-6c709152.westus2.azurecontainerapps.io/sse"
 
+# Shared client so all tests multiplex over one TLS connection to the server
+_CLIENT_OPTIONS = dict(
+    timeout=10.0,
+    follow_redirects=True,
+    limits=httpx.Limits(max_keepalive_connections=1),
+)
+try:
+    _CLIENT = httpx.Client(http2=True, **_CLIENT_OPTIONS)
+except ImportError:
+    # HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+    _CLIENT = httpx.Client(**_CLIENT_OPTIONS)
+
 def test_health_endpoint():
     """Test the health endpoint."""
     print("=" * 80)
@@ -17,10 +32,14 @@ def test_health_endpoint():
     print("=" * 80)
     try:
         health_url = MCP_SERVER_URL.replace("/sse", "/health")
-        response = requests.get(health_url, timeout=10)
+        response = _CLIENT.get(health_url)
         print(f"✓ Status Code: {response.status_code}")
         print(f"✓ Response: {response.text}")
         return True
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        # Server unreachable - let main() skip the remaining tests
+        print(f"✗ Health check failed: {e}")
+        raise
     except Exception as e:
         print(f"✗ Health check failed: {e}")
         return False
@@ -49,14 +68,13 @@ def test_initialize():
     print(f"Request: {json.dumps(initialize_request, indent=2)}")
     
     try:
-        response = requests.post(
+        response = _CLIENT.post(
             MCP_SERVER_URL,
             json=initialize_request,
             headers={
                 "Content-Type": "application/json",
                 "Accept": "application/json"
-            },
-            timeout=10
+            }
         )
         print(f"\n✓ Status Code: {response.status_code}")
         print(f"✓ Headers: {dict(response.headers)}")
@@ -95,14 +113,13 @@ def test_tools_list():
     print(f"Request: {json.dumps(tools_request, indent=2)}")
     
     try:
-        response = requests.post(
+        response = _CLIENT.post(
             MCP_SERVER_URL,
             json=tools_request,
             headers={
                 "Content-Type": "application/json",
                 "Accept": "application/json"
-            },
-            timeout=10
+            }
         )
         print(f"\n✓ Status Code: {response.status_code}")
         print(f"✓ Headers: {dict(response.headers)}")
@@ -141,7 +158,7 @@ def test_get_request():
     print("=" * 80)
     
     try:
-        response = requests.get(MCP_SERVER_URL, timeout=10)
+        response = _CLIENT.get(MCP_SERVER_URL)
         print(f"✓ Status Code: {response.status_code}")
         print(f"✓ Response: {response.text[:500]}")
         
@@ -163,7 +180,7 @@ def test_root_endpoint():
     
     try:
         root_url = MCP_SERVER_URL.replace("/sse", "/")
-        response = requests.get(root_url, timeout=10)
+        response = _CLIENT.get(root_url)
         print(f"✓ Status Code: {response.status_code}")
         print(f"✓ Response: {response.text[:500]}")
         
@@ -175,6 +192,35 @@ def test_root_endpoint():
         print(f"✗ Root endpoint test failed: {e}")
         return False
 
+class _ThreadLocalStdout:
+    """Sends print() output from worker threads to per-test buffers so reports don't interleave."""
+    
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+    
+    def capture(self, buffer):
+        self._local.buffer = buffer
+    
+    def release(self):
+        del self._local.buffer
+    
+    def write(self, text):
+        return getattr(self._local, "buffer", self._stream).write(text)
+    
+    def flush(self):
+        getattr(self._local, "buffer", self._stream).flush()
+
+
+def _run_captured(stdout, fn):
+    """Run a test in a worker thread, returning its result and printed output."""
+    buffer = io.StringIO()
+    stdout.capture(buffer)
+    try:
+        return fn(), buffer.getvalue()
+    finally:
+        stdout.release()
+
 def main():
     """Run all tests."""
     print("🔍 QuickBooks MCP Server Diagnostic Tool")
@@ -182,12 +228,36 @@ def main():
     
     results = []
     
-    # Run tests
-    results.append(("Health Endpoint", test_health_endpoint()))
-    results.append(("Initialize", test_initialize()))
-    results.append(("Tools List", test_tools_list()))
-    results.append(("GET Request", test_get_request()))
-    results.append(("Root Endpoint", test_root_endpoint()))
+    # Health check first: if the server is unreachable every other test would just time out
+    try:
+        results.append(("Health Endpoint", test_health_endpoint()))
+    except (httpx.ConnectError, httpx.ConnectTimeout):
+        print("\n✗ MCP server unreachable - skipping remaining tests")
+        sys.exit(1)
+    
+    # The remaining tests are independent requests, so run them concurrently
+    tests = [
+        ("Initialize", test_initialize),
+        ("Tools List", test_tools_list),
+        ("GET Request", test_get_request),
+        ("Root Endpoint", test_root_endpoint),
+    ]
+    stdout = _ThreadLocalStdout(sys.stdout)
+    sys.stdout = stdout
+    try:
+        with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+            futures = {executor.submit(_run_captured, stdout, fn): name for name, fn in tests}
+            completed = {}
+            for future in as_completed(futures):
+                completed[futures[future]] = future.result()
+    finally:
+        sys.stdout = stdout._stream
+    
+    # Report in the usual order
+    for name, _ in tests:
+        passed, output = completed[name]
+        print(output, end="")
+        results.append((name, passed))
     
     # Summary
     print("\n" + "=" * 80)